@@ -8,14 +8,53 @@ These recipes use minimal geometric changes that are hard to notice
 in social media feeds but sufficient to evade duplicate detection.
 """
 
-import random
-from typing import Dict, List, Callable, Tuple
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Callable, Optional, Tuple
 
 import cv2
 import numpy as np
 
 
-def micro_crop(image: np.ndarray) -> np.ndarray:
+# Shared generator; each recipe draws all of its parameters in one call
+_rng = np.random.default_rng()
+
+
+def _reseed_rng() -> None:
+    """Give a forked child process its own RNG stream instead of a copy of the parent's."""
+    global _rng
+    _rng = np.random.default_rng()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reseed_rng)
+
+
+def _crop_resize(
+    image: np.ndarray,
+    top: int,
+    bottom: int,
+    left: int,
+    right: int,
+    out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Crop the given margins off each edge and resize back to the input size.
+
+    The crop is a strided view, which cv2.resize reads directly, so the
+    resample is the only pass over the pixels. If `out` is given the
+    result is written into it.
+    """
+    h, w = image.shape[:2]
+    cropped = image[top:h-bottom, left:w-right]
+    return cv2.resize(cropped, (w, h), dst=out, interpolation=cv2.INTER_LANCZOS4)
+
+
+def micro_crop(
+    image: np.ndarray,
+    out: Optional[np.ndarray] = None,
+    rng: Optional[np.random.Generator] = None
+) -> np.ndarray:
     """
     Recipe 1: Micro Crop (3-5% from edges)
 
@@ -23,24 +62,35 @@ def micro_crop(image: np.ndarray) -> np.ndarray:
     3% crop = distance ~64, 5% crop = distance ~80+
     """
     h, w = image.shape[:2]
-    crop_pct = random.uniform(0.04, 0.06)  # 4-6%
+    r = (rng or _rng).random(5)
+    crop_pct = 0.04 + 0.02 * r[0]  # 4-6%
 
     margin_h = int(h * crop_pct)
     margin_w = int(w * crop_pct)
 
-    # Random which edges to crop more
-    top = random.randint(0, margin_h)
-    bottom = random.randint(0, margin_h)
-    left = random.randint(0, margin_w)
-    right = random.randint(0, margin_w)
+    # Random which edges to crop more (each uniform in [0, margin])
+    top = int(r[1] * (margin_h + 1))
+    bottom = int(r[2] * (margin_h + 1))
+    left = int(r[3] * (margin_w + 1))
+    right = int(r[4] * (margin_w + 1))
 
-    cropped = image[top:h-bottom, left:w-right]
-    result = cv2.resize(cropped, (w, h), interpolation=cv2.INTER_LANCZOS4)
+    return _crop_resize(image, top, bottom, left, right, out)
 
-    return result
+
+def _micro_rotate_matrix(h: int, w: int, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """Sample a 2-4 degree rotation about the image center."""
+    r = (rng or _rng).random(2)
+    angle = np.copysign(2.0 + 2.0 * r[0], r[1] - 0.5)  # +/-2-4 degrees
+
+    center = (w // 2, h // 2)
+    return cv2.getRotationMatrix2D(center, angle, 1.0)
 
 
-def micro_rotate(image: np.ndarray) -> np.ndarray:
+def micro_rotate(
+    image: np.ndarray,
+    out: Optional[np.ndarray] = None,
+    rng: Optional[np.random.Generator] = None
+) -> np.ndarray:
     """
     Recipe 2: Micro Rotation (2-4 degrees)
 
@@ -48,21 +98,30 @@ def micro_rotate(image: np.ndarray) -> np.ndarray:
     to avoid black corners.
     """
     h, w = image.shape[:2]
-    angle = random.uniform(2.0, 4.0) * random.choice([-1, 1])
-
-    center = (w // 2, h // 2)
-    matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
+    matrix = _micro_rotate_matrix(h, w, rng)
 
     # Use border reflection to fill edges with mirrored pixels (no black corners)
     result = cv2.warpAffine(
         image, matrix, (w, h),
+        dst=out,
         borderMode=cv2.BORDER_REFLECT_101
     )
 
     return result
 
 
-def center_zoom_crop(image: np.ndarray) -> np.ndarray:
+def _center_zoom_margins(h: int, w: int, rng: Optional[np.random.Generator] = None) -> Tuple[int, int]:
+    """Sample uniform (vertical, horizontal) margins for a center zoom."""
+    # Crop 4-6% from all edges uniformly (zooms into center)
+    crop_pct = 0.04 + 0.02 * (rng or _rng).random()
+    return int(h * crop_pct), int(w * crop_pct)
+
+
+def center_zoom_crop(
+    image: np.ndarray,
+    out: Optional[np.ndarray] = None,
+    rng: Optional[np.random.Generator] = None
+) -> np.ndarray:
     """
     Recipe 3: Center Zoom Crop
 
@@ -70,43 +129,60 @@ def center_zoom_crop(image: np.ndarray) -> np.ndarray:
     Doesn't distort proportions - safe for portraits.
     """
     h, w = image.shape[:2]
-
-    # Crop 4-6% from all edges uniformly (zooms into center)
-    crop_pct = random.uniform(0.04, 0.06)
-    margin_h = int(h * crop_pct)
-    margin_w = int(w * crop_pct)
+    margin_h, margin_w = _center_zoom_margins(h, w, rng)
 
     # Uniform crop from all sides
-    cropped = image[margin_h:h-margin_h, margin_w:w-margin_w]
-    result = cv2.resize(cropped, (w, h), interpolation=cv2.INTER_LANCZOS4)
-
-    return result
+    return _crop_resize(image, margin_h, margin_h, margin_w, margin_w, out)
 
 
-def crop_and_rotate(image: np.ndarray) -> np.ndarray:
+def crop_and_rotate(
+    image: np.ndarray,
+    out: Optional[np.ndarray] = None,
+    rng: Optional[np.random.Generator] = None
+) -> np.ndarray:
     """
     Recipe 4: Combined Crop + Rotation
 
-    Crop combined with rotation for stronger effect.
+    Crop combined with rotation for stronger effect. Both steps are
+    composed into one affine matrix so the image is resampled once.
     """
-    # First apply crop
     h, w = image.shape[:2]
-    crop_pct = random.uniform(0.02, 0.03)  # 2-3%
+    r = (rng or _rng).random(3)
+    crop_pct = 0.02 + 0.01 * r[0]  # 2-3%
     margin = int(min(h, w) * crop_pct)
 
-    cropped = image[margin:h-margin, margin:w-margin]
-    cropped = cv2.resize(cropped, (w, h), interpolation=cv2.INTER_LANCZOS4)
-
-    # Then apply rotation with border reflection (no black corners)
-    angle = random.uniform(1.5, 2.5) * random.choice([-1, 1])
+    # Crop + resize back as an affine map (pixel-center aligned like cv2.resize)
+    sx = w / (w - 2 * margin)
+    sy = h / (h - 2 * margin)
+    crop_matrix = np.array([
+        [sx, 0.0, (0.5 - margin) * sx - 0.5],
+        [0.0, sy, (0.5 - margin) * sy - 0.5],
+        [0.0, 0.0, 1.0],
+    ])
+
+    # Rotation about the center, applied after the crop
+    angle = np.copysign(1.5 + r[1], r[2] - 0.5)  # +/-1.5-2.5 degrees
     center = (w // 2, h // 2)
-    matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
-    result = cv2.warpAffine(cropped, matrix, (w, h), borderMode=cv2.BORDER_REFLECT_101)
+    rotate_matrix = np.vstack([cv2.getRotationMatrix2D(center, angle, 1.0), [0.0, 0.0, 1.0]])
+
+    matrix = (rotate_matrix @ crop_matrix)[:2]
+
+    # Border reflection fills the rotated corners (no black corners)
+    result = cv2.warpAffine(
+        image, matrix, (w, h),
+        dst=out,
+        flags=cv2.INTER_LANCZOS4,
+        borderMode=cv2.BORDER_REFLECT_101
+    )
 
     return result
 
 
-def asymmetric_crop(image: np.ndarray) -> np.ndarray:
+def asymmetric_crop(
+    image: np.ndarray,
+    out: Optional[np.ndarray] = None,
+    rng: Optional[np.random.Generator] = None
+) -> np.ndarray:
     """
     Recipe 5: Asymmetric Crop
 
@@ -116,9 +192,10 @@ def asymmetric_crop(image: np.ndarray) -> np.ndarray:
     h, w = image.shape[:2]
 
     # More crop from one random side
-    side = random.choice(['top', 'bottom', 'left', 'right'])
-    heavy_crop = random.uniform(0.04, 0.06)  # 4-6%
-    light_crop = random.uniform(0.01, 0.02)  # 1-2%
+    r = (rng or _rng).random(3)
+    side = ('top', 'bottom', 'left', 'right')[int(r[0] * 4)]
+    heavy_crop = 0.04 + 0.02 * r[1]  # 4-6%
+    light_crop = 0.01 + 0.01 * r[2]  # 1-2%
 
     if side == 'top':
         top = int(h * heavy_crop)
@@ -137,40 +214,59 @@ def asymmetric_crop(image: np.ndarray) -> np.ndarray:
         left = int(w * light_crop)
         top = bottom = int(h * light_crop)
 
-    cropped = image[top:h-bottom, left:w-right]
-    result = cv2.resize(cropped, (w, h), interpolation=cv2.INTER_LANCZOS4)
-
-    return result
+    return _crop_resize(image, top, bottom, left, right, out)
 
 
-def scale_shift(image: np.ndarray) -> np.ndarray:
+def scale_shift(
+    image: np.ndarray,
+    out: Optional[np.ndarray] = None,
+    rng: Optional[np.random.Generator] = None
+) -> np.ndarray:
     """
     Recipe 6: Scale and Shift
 
-    Scales up and shifts the crop window.
+    Scales up and shifts the crop window. The scale and the window
+    offset form one affine matrix, so only the (h, w) output is ever
+    computed - no enlarged intermediate image.
     """
     h, w = image.shape[:2]
 
     # Scale up by 4-6%
-    scale = random.uniform(1.04, 1.06)
+    r = (rng or _rng).random(3)
+    scale = 1.04 + 0.02 * r[0]
     new_h, new_w = int(h * scale), int(w * scale)
 
-    scaled = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LANCZOS4)
-
-    # Random crop position
+    # Random crop position within the enlarged frame
     max_offset_h = new_h - h
     max_offset_w = new_w - w
 
-    offset_h = random.randint(0, max_offset_h)
-    offset_w = random.randint(0, max_offset_w)
+    offset_h = int(r[1] * (max_offset_h + 1))
+    offset_w = int(r[2] * (max_offset_w + 1))
 
-    result = scaled[offset_h:offset_h+h, offset_w:offset_w+w]
+    # Upscale (pixel-center aligned like cv2.resize), then shift by the offset
+    sx = new_w / w
+    sy = new_h / h
+    matrix = np.array([
+        [sx, 0.0, 0.5 * sx - 0.5 - offset_w],
+        [0.0, sy, 0.5 * sy - 0.5 - offset_h],
+    ])
+
+    result = cv2.warpAffine(
+        image, matrix, (w, h),
+        dst=out,
+        flags=cv2.INTER_LANCZOS4,
+        borderMode=cv2.BORDER_REFLECT_101
+    )
 
     return result
 
 
 # Recipe registry
-RECIPES: Dict[str, Callable[[np.ndarray], np.ndarray]] = {
+# Each recipe takes (image, out=None, rng=None) and returns an image of the
+# same size; when `out` is given the result is written into it. `rng`
+# overrides the shared generator, so a seeded Generator replays the same
+# (size-relative) parameters on another copy of the image.
+RECIPES: Dict[str, Callable[..., np.ndarray]] = {
     'micro_crop': micro_crop,
     'micro_rotate': micro_rotate,
     'center_zoom': center_zoom_crop,
@@ -190,30 +286,155 @@ def get_random_recipe(enabled_recipes: List[str] = None) -> Tuple[str, Callable]
     if enabled_recipes is None:
         enabled_recipes = list(RECIPES.keys())
 
-    recipe_name = random.choice(enabled_recipes)
+    recipe_name = enabled_recipes[_rng.integers(len(enabled_recipes))]
     recipe_fn = RECIPES[recipe_name]
 
     return recipe_name, recipe_fn
 
 
-def apply_augmentation(
-    image: np.ndarray,
+def _pick_recipe(
     recipe_name: str = None,
-    enabled_recipes: List[str] = None
-) -> Tuple[np.ndarray, str]:
+    enabled_recipes: List[str] = None,
+    rng: Optional[np.random.Generator] = None,
+    recipe_weights: Optional[List[float]] = None
+) -> str:
     """
-    Apply a geometric augmentation to break PDQ hash.
+    Validate an explicit recipe name, or pick a random enabled one.
+
+    recipe_weights (one non-negative weight per enabled recipe) biases the
+    pick; without it every recipe is equally likely.
     """
     if recipe_name is not None:
         if recipe_name not in RECIPES:
             raise ValueError(f"Unknown recipe: {recipe_name}")
-        return RECIPES[recipe_name](image), recipe_name
+        return recipe_name
 
-    # Pick a random recipe
     available = enabled_recipes or list(RECIPES.keys())
-    name = random.choice(available)
+    rng = rng or _rng
+    if recipe_weights is None:
+        return available[rng.integers(len(available))]
+
+    p = np.asarray(recipe_weights, dtype=np.float64)
+    return available[rng.choice(len(available), p=p / p.sum())]
+
+
+def apply_augmentation(
+    image: np.ndarray,
+    recipe_name: str = None,
+    enabled_recipes: List[str] = None,
+    rng: Optional[np.random.Generator] = None,
+    recipe_weights: Optional[List[float]] = None
+) -> Tuple[np.ndarray, str]:
+    """
+    Apply a geometric augmentation to break PDQ hash.
+
+    Pass `rng` (e.g. np.random.default_rng(seed)) to make the recipe choice
+    and its parameters reproducible, and `recipe_weights` (aligned with
+    enabled_recipes) to bias which recipe is picked.
+    """
+    name = _pick_recipe(recipe_name, enabled_recipes, rng, recipe_weights)
+    return RECIPES[name](image, rng=rng), name
+
+
+def apply_augmentation_into(
+    image: np.ndarray,
+    out: np.ndarray,
+    recipe_name: str = None,
+    enabled_recipes: List[str] = None,
+    rng: Optional[np.random.Generator] = None,
+    recipe_weights: Optional[List[float]] = None
+) -> Tuple[np.ndarray, str]:
+    """
+    Like apply_augmentation, but write the result into a preallocated buffer.
+
+    Reusing one `out` array across calls avoids allocating a full-size
+    image per attempt. `out` must match the input's shape and dtype.
+    """
+    if out.shape != image.shape or out.dtype != image.dtype:
+        raise ValueError(
+            f"Output buffer {out.shape}/{out.dtype} does not match "
+            f"image {image.shape}/{image.dtype}"
+        )
+
+    name = _pick_recipe(recipe_name, enabled_recipes, rng, recipe_weights)
+    return RECIPES[name](image, out=out, rng=rng), name
+
+
+def apply_augmentation_batch(images: np.ndarray, recipe_name: str) -> np.ndarray:
+    """
+    Apply one recipe to a stack of same-sized images.
+
+    center_zoom and micro_rotate draw their parameters once and share them
+    across the batch: the crop is a single view over all N images and the
+    rotation matrix is built once. Other recipes draw per image. Results
+    are written into one preallocated output stack.
+
+    Args:
+        images: (N, H, W, C) array of images
+        recipe_name: Recipe to apply to every image
 
-    return RECIPES[name](image), name
+    Returns:
+        (N, H, W, C) array of augmented images
+    """
+    if recipe_name not in RECIPES:
+        raise ValueError(f"Unknown recipe: {recipe_name}")
+
+    n, h, w = images.shape[:3]
+    out = np.empty_like(images)
+
+    if recipe_name == 'center_zoom':
+        margin_h, margin_w = _center_zoom_margins(h, w)
+        cropped = images[:, margin_h:h-margin_h, margin_w:w-margin_w]
+        for i in range(n):
+            cv2.resize(cropped[i], (w, h), dst=out[i], interpolation=cv2.INTER_LANCZOS4)
+    elif recipe_name == 'micro_rotate':
+        matrix = _micro_rotate_matrix(h, w)
+        for i in range(n):
+            cv2.warpAffine(
+                images[i], matrix, (w, h),
+                dst=out[i],
+                borderMode=cv2.BORDER_REFLECT_101
+            )
+    else:
+        recipe_fn = RECIPES[recipe_name]
+        for i in range(n):
+            recipe_fn(images[i], out=out[i])
+
+    return out
+
+
+def apply_augmentation_parallel(
+    images: List[np.ndarray],
+    recipe_name: str = None,
+    enabled_recipes: List[str] = None,
+    workers: Optional[int] = None
+) -> List[Tuple[np.ndarray, str]]:
+    """
+    Augment a list of images on a thread pool.
+
+    OpenCV releases the GIL inside resize/warpAffine, so threads give real
+    parallelism here. OpenCV's own internal threading is turned off for the
+    duration to avoid oversubscribing cores, and restored afterwards.
+
+    Args:
+        images: Images to augment (sizes may differ)
+        recipe_name: Recipe to apply to every image, or None for random
+        enabled_recipes: Recipes to pick from when recipe_name is None
+        workers: Thread count (default: os.cpu_count())
+
+    Returns:
+        List of (augmented_image, recipe_name) in input order
+    """
+    cv2_threads = cv2.getNumThreads()
+    cv2.setNumThreads(1)
+    try:
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            return list(pool.map(
+                lambda image: apply_augmentation(image, recipe_name, enabled_recipes),
+                images,
+            ))
+    finally:
+        cv2.setNumThreads(cv2_threads)
 
 
 def create_sized_recipe(recipe_name: str, height: int, width: int):
@@ -2,16 +2,39 @@
 Image utilities for EXIF handling, format conversion, and resizing.
 """
 
+import math
+import os
+import re
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional, Tuple, List
 from io import BytesIO
 
-from PIL import Image, ExifTags, ImageOps
+from PIL import Image, ExifTags
+import cv2
 import numpy as np
 
 
 SUPPORTED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.heic', '.heif'}
 
+# EXIF orientation tag value -> transpose that undoes it
+_EXIF_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+# Modes cv2.resize can average channel-wise; palette and bilevel images can't be
+_CV2_RESIZE_MODES = {'RGB', 'RGBA', 'L'}
+
+# Target size strings like '1080x1350' (case-insensitive 'x', spaces allowed
+# around it); both sides must be positive
+_SIZE_RE = re.compile(r'(0*[1-9]\d*)\s*x\s*(0*[1-9]\d*)', re.IGNORECASE)
+
 
 def get_supported_images(directory: str) -> List[Path]:
     """
@@ -27,40 +50,69 @@ def get_supported_images(directory: str) -> List[Path]:
     if not dir_path.exists():
         raise FileNotFoundError(f"Directory not found: {directory}")
 
-    images = []
-    for ext in SUPPORTED_EXTENSIONS:
-        images.extend(dir_path.glob(f"*{ext}"))
-        images.extend(dir_path.glob(f"*{ext.upper()}"))
+    # Single directory pass; extension match is case-insensitive
+    exts = tuple(SUPPORTED_EXTENSIONS)
+    with os.scandir(dir_path) as it:
+        images = [
+            Path(entry.path) for entry in it
+            if entry.is_file() and entry.name.lower().endswith(exts)
+        ]
 
-    return sorted(images, key=lambda p: p.name.lower())
+    images.sort(key=lambda p: p.name.lower())
+    return images
 
 
-def normalize_exif_orientation(image_path: str) -> Image.Image:
+def normalize_exif_orientation(
+    image_path: str,
+    target_size: Optional[Tuple[int, int]] = None
+) -> Image.Image:
     """
     Load image and apply EXIF orientation, return normalized PIL Image.
 
+    The orientation tag is read before any pixels are decoded. When the
+    image is headed for resize_to_target, JPEGs are decoded directly at a
+    reduced 1/2, 1/4 or 1/8 scale (libjpeg DCT scaling) that still covers
+    target_size, so the full-resolution pixels are never produced.
+
     Args:
         image_path: Path to image file
+        target_size: Optional (width, height) the image will be fit into
+            afterwards; enables the reduced-scale JPEG decode
 
     Returns:
         PIL Image with correct orientation
     """
     img = Image.open(image_path)
 
-    # Apply EXIF orientation using ImageOps
-    img = ImageOps.exif_transpose(img)
+    # Header only: Image.open hasn't decoded any pixel data yet
+    orientation = img.getexif().get(ExifTags.Base.Orientation, 1)
+    method = _EXIF_TRANSPOSE.get(orientation)
+
+    if target_size is not None:
+        # draft() works in stored orientation; 5-8 swap width and height
+        draft_size = target_size[::-1] if orientation in (5, 6, 7, 8) else target_size
+        img.draft(None, draft_size)  # no-op for formats other than JPEG
+
+    img.load()
+
+    # Apply EXIF orientation with a single transpose. Upright images
+    # (orientation 1, the common case) need no pixel work at all, unlike
+    # ImageOps.exif_transpose which returns a full copy
+    if method is not None:
+        img = img.transpose(method)
 
     # Convert to RGB if necessary (handles RGBA, P, L modes)
     if img.mode in ('RGBA', 'P', 'LA'):
-        # Create white background for transparency
-        background = Image.new('RGB', img.size, (255, 255, 255))
-        if img.mode == 'P':
-            img = img.convert('RGBA')
-        if img.mode in ('RGBA', 'LA'):
-            background.paste(img, mask=img.split()[-1])  # Use alpha channel as mask
-            img = background
-        else:
-            img = img.convert('RGB')
+        # Composite onto white in one vectorized pass:
+        # out = rgb * a + 255 * (1 - a) = 255 + (rgb - 255) * a
+        rgba = np.asarray(img.convert('RGBA'))
+        alpha = rgba[..., 3:4].astype(np.float32)
+        alpha *= 1 / 255.0
+        blended = rgba[..., :3].astype(np.float32)
+        blended -= 255.0
+        np.multiply(blended, alpha, out=blended)
+        blended += 255.5  # +0.5 so the uint8 cast rounds
+        img = Image.fromarray(blended.astype(np.uint8), 'RGB')
     elif img.mode != 'RGB':
         img = img.convert('RGB')
 
@@ -86,20 +138,62 @@ def resize_to_target(
     if target_size is None:
         return image
 
-    target_w, target_h = target_size
+    if image.mode not in _CV2_RESIZE_MODES:
+        # Palette, bilevel etc.: let PIL pick a suitable filter (on a copy,
+        # since thumbnail resizes in place)
+        if preserve_aspect:
+            image = image.copy()
+            image.thumbnail(target_size, Image.Resampling.LANCZOS)
+            return image
+        return image.resize(target_size, Image.Resampling.LANCZOS)
 
     if preserve_aspect:
-        # Resize to fit within target while preserving aspect ratio
-        image.thumbnail((target_w, target_h), Image.Resampling.LANCZOS)
+        target_w, target_h = _thumbnail_size(image.size, target_size)
+    else:
+        target_w, target_h = target_size
+
+    # Already the right size: skip the O(H*W) resample entirely
+    if (target_w, target_h) == image.size:
         return image
+
+    if target_w * target_h < image.width * image.height:
+        # Downscale: OpenCV's INTER_AREA is SIMD-vectorized and antialiases well
+        resized = cv2.resize(np.asarray(image), (target_w, target_h), interpolation=cv2.INTER_AREA)
+        return Image.fromarray(resized)
+
+    return image.resize((target_w, target_h), Image.Resampling.LANCZOS)
+
+
+def _thumbnail_size(size: Tuple[int, int], box: Tuple[int, int]) -> Tuple[int, int]:
+    """
+    Size that fits `size` within `box` keeping its aspect ratio, never enlarging.
+
+    Rounds exactly like Image.thumbnail: of the floor and ceil of the scaled
+    side, take whichever keeps the aspect ratio closest.
+    """
+    width, height = size
+    x, y = box
+    if x >= width and y >= height:
+        return size
+
+    aspect = width / height
+    if x / y >= aspect:
+        scaled = y * aspect
+        x = min(math.floor(scaled), math.ceil(scaled), key=lambda n: abs(aspect - n / y))
     else:
-        # Force exact dimensions
-        return image.resize((target_w, target_h), Image.Resampling.LANCZOS)
+        scaled = x / aspect
+        y = min(math.floor(scaled), math.ceil(scaled), key=lambda n: 0 if n == 0 else abs(aspect - x / n))
+    return max(x, 1), max(y, 1)
 
 
-def pil_to_numpy(image: Image.Image) -> np.ndarray:
-    """Convert PIL Image to numpy array (RGB format for albumentations)."""
-    return np.array(image)
+def pil_to_numpy(image: Image.Image, copy: bool = False) -> np.ndarray:
+    """
+    Convert PIL Image to numpy array (RGB format for augmentation).
+
+    By default returns a read-only array over PIL's exported buffer,
+    skipping np.array's extra copy. Pass copy=True for a writable array.
+    """
+    return np.array(image) if copy else np.asarray(image)
 
 
 def numpy_to_pil(array: np.ndarray) -> Image.Image:
@@ -113,7 +207,7 @@ def save_as_jpeg(
     quality: int = 95
 ) -> None:
     """
-    Save image as high-quality JPEG.
+    Save image as high-quality JPEG (see save_array_as_jpeg).
 
     Args:
         image: PIL Image to save
@@ -124,13 +218,37 @@ def save_as_jpeg(
     if image.mode != 'RGB':
         image = image.convert('RGB')
 
-    image.save(
-        output_path,
-        'JPEG',
-        quality=quality,
-        optimize=True,
-        progressive=True
-    )
+    save_array_as_jpeg(np.asarray(image), output_path, quality)
+
+
+def save_array_as_jpeg(
+    array: np.ndarray,
+    output_path: str,
+    quality: int = 95
+) -> None:
+    """
+    Save an (H, W, 3) uint8 RGB array as high-quality JPEG.
+
+    Encodes through OpenCV's bundled libjpeg-turbo (SIMD Huffman/DCT).
+    Huffman table optimization is skipped: it costs a second entropy
+    pass for a marginal size gain.
+
+    Args:
+        array: RGB image array
+        output_path: Path to save to
+        quality: JPEG quality (1-100)
+    """
+    bgr = cv2.cvtColor(array, cv2.COLOR_RGB2BGR)
+    ok, encoded = cv2.imencode('.jpg', bgr, [
+        cv2.IMWRITE_JPEG_QUALITY, quality,
+        cv2.IMWRITE_JPEG_PROGRESSIVE, 1,
+        cv2.IMWRITE_JPEG_OPTIMIZE, 0,
+    ])
+    if not ok:
+        raise ValueError(f"Failed to encode JPEG: {output_path}")
+
+    # Write the bytes ourselves; cv2.imwrite can't handle non-ASCII paths on Windows
+    Path(output_path).write_bytes(encoded.tobytes())
 
 
 def get_image_size_mb(image_path: str) -> float:
@@ -138,6 +256,7 @@ def get_image_size_mb(image_path: str) -> float:
     return Path(image_path).stat().st_size / (1024 * 1024)
 
 
+@lru_cache(maxsize=16)
 def parse_target_size(size_str: Optional[str]) -> Optional[Tuple[int, int]]:
     """
     Parse target size string like '1080x1350' into (width, height) tuple.
@@ -151,10 +270,7 @@ def parse_target_size(size_str: Optional[str]) -> Optional[Tuple[int, int]]:
     if size_str is None:
         return None
 
-    try:
-        parts = size_str.lower().split('x')
-        if len(parts) != 2:
-            raise ValueError(f"Invalid size format: {size_str}")
-        return (int(parts[0]), int(parts[1]))
-    except (ValueError, IndexError) as e:
-        raise ValueError(f"Invalid size format '{size_str}'. Expected format: WIDTHxHEIGHT (e.g., 1080x1350)")
+    match = _SIZE_RE.fullmatch(size_str.strip())
+    if not match:
+        raise ValueError(f"Invalid size format '{size_str}'. Expected format: WIDTHxHEIGHT with positive sizes (e.g., 1080x1350)")
+    return (int(match[1]), int(match[2]))
@@ -0,0 +1,47 @@
+"""
+JSON output helpers shared by the manifest and scan report writers.
+"""
+
+import json
+from pathlib import Path
+from typing import Iterable
+
+
+def write_json_streaming(
+    path: Path,
+    data: dict,
+    stream_key: str,
+    container: str = "[]"
+) -> None:
+    """
+    Write a dict as indented JSON, streaming one key's contents from an iterable.
+
+    data[stream_key] must be an iterable of already-encoded JSON members:
+    values for a list, or '"key": value' pairs for an object. They are
+    written one per line as they are produced, so a huge section never
+    has to be held in memory or run through the pure-Python indenting
+    encoder. Every other key is written with json.dumps(indent=2).
+
+    Args:
+        path: File to write
+        data: Top-level object to write
+        stream_key: Key whose value is the iterable of encoded members
+        container: "[]" to wrap the members in a list, "{}" for an object
+    """
+    opening, closing = container
+    with open(path, "w") as f:
+        f.write("{")
+        for n, (key, value) in enumerate(data.items()):
+            f.write(",\n  " if n else "\n  ")
+            f.write(f"{json.dumps(key)}: ")
+
+            if key == stream_key:
+                f.write(opening)
+                count = 0
+                for count, member in enumerate(value, 1):
+                    f.write(",\n    " if count > 1 else "\n    ")
+                    f.write(member)
+                f.write(f"\n  {closing}" if count else closing)
+            else:
+                f.write(json.dumps(value, indent=2).replace("\n", "\n  "))
+        f.write("\n}\n")
@@ -6,14 +6,23 @@ Generate unique image variants that evade PDQ hash matching while
 maintaining visual quality for marketing purposes.
 """
 
+import heapq
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import islice
 from pathlib import Path
-from typing import Optional, List
+from statistics import fmean
+from typing import Iterator, Optional, List, Tuple
 
+import numpy as np
 import typer
 from rich.console import Console
+from rich.progress import Progress
 from rich.table import Table
 
-from image_utils import get_supported_images, get_image_size_mb
+from image_utils import get_supported_images, parse_target_size
+from json_utils import write_json_streaming
 from spoofer import SpoofingConfig, process_images, save_manifest
 from augmentations import get_recipe_names
 
@@ -84,6 +93,12 @@ def spoof(
         "--verbose", "-v",
         help="Show detailed logging",
     ),
+    workers: Optional[int] = typer.Option(
+        None,
+        "--workers", "-w",
+        help="Images to process in parallel (default: CPU count)",
+        min=1,
+    ),
 ):
     """
     Generate spoofed image variants.
@@ -95,13 +110,10 @@ def spoof(
     # Validate target size format if provided
     if target_size:
         try:
-            parts = target_size.lower().split('x')
-            if len(parts) != 2:
-                raise ValueError()
-            int(parts[0]), int(parts[1])
-        except (ValueError, IndexError):
+            parse_target_size(target_size)
+        except ValueError:
             console.print(f"[red]Invalid target size format: {target_size}[/red]")
-            console.print("Expected format: WIDTHxHEIGHT (e.g., 1080x1350)")
+            console.print("Expected format: WIDTHxHEIGHT with positive sizes (e.g., 1080x1350)")
             raise typer.Exit(1)
 
     # Find input images
@@ -132,11 +144,11 @@ def spoof(
         console.print("[yellow]DRY RUN - no files will be written[/yellow]")
     console.print()
 
-    # Warn about large images
+    # Warn about large images (one stat per file, compared in bytes)
     for img_path in image_paths:
-        size_mb = get_image_size_mb(str(img_path))
-        if size_mb > 10:
-            console.print(f"[yellow]Warning: {img_path.name} is {size_mb:.1f}MB[/yellow]")
+        size_bytes = img_path.stat().st_size
+        if size_bytes > 10 * 1024 * 1024:
+            console.print(f"[yellow]Warning: {img_path.name} is {size_bytes / (1024 * 1024):.1f}MB[/yellow]")
 
     # Create output directory
     if not dry_run:
@@ -154,6 +166,7 @@ def spoof(
         enabled_recipes=None,  # Use all recipes
         dry_run=dry_run,
         verbose=verbose,
+        workers=workers,
     )
 
     # Process images
@@ -172,13 +185,17 @@ def spoof(
     table.add_column("Attempts", justify="right")
     table.add_column("Status", justify="center")
 
-    for name, data in manifest["images"].items():
+    # Large batches only list the first 50 images; the totals below cover all of them
+    images = manifest["images"]
+    shown = len(images) if len(images) <= 100 else 50
+
+    for name, data in islice(images.items(), shown):
         if data["skipped_reason"]:
             status = f"[red]Skipped: {data['skipped_reason']}[/red]"
             table.add_row(name, "-", "-", "-", status)
         else:
             num_variants = len(data["variants"])
-            avg_dist = sum(v["distance_from_original"] for v in data["variants"]) / max(num_variants, 1)
+            avg_dist = fmean(v["distance_from_original"] for v in data["variants"]) if num_variants else 0.0
             attempts = data["total_attempts"]
 
             if num_variants == variants:
@@ -196,6 +213,9 @@ def spoof(
                 status,
             )
 
+    if shown < len(images):
+        table.add_row("...", "...", "...", "...", f"[dim]+{len(images) - shown} more[/dim]")
+
     console.print(table)
 
     # Final summary
@@ -234,12 +254,12 @@ def check(
     ),
 ):
     """Check PDQ hash and quality for a single image."""
-    from pdq_checker import get_pdq_hash_from_path
+    from pdq_checker import get_pdq_hash_from_path_cached
 
     console.print(f"[bold]Checking: {image_path}[/bold]")
 
     try:
-        pdq_hash, quality = get_pdq_hash_from_path(str(image_path))
+        pdq_hash, quality = get_pdq_hash_from_path_cached(str(image_path))
         console.print(f"PDQ Hash:    {pdq_hash}")
         console.print(f"Quality:     {quality}")
 
@@ -267,14 +287,14 @@ def compare(
     ),
 ):
     """Compare PDQ hashes of two images."""
-    from pdq_checker import get_pdq_hash_from_path, hamming_distance
+    from pdq_checker import get_pdq_hash_from_path_cached, hamming_distance
 
     console.print(f"[bold]Comparing images[/bold]")
     console.print()
 
     try:
-        hash1, qual1 = get_pdq_hash_from_path(str(image1))
-        hash2, qual2 = get_pdq_hash_from_path(str(image2))
+        hash1, qual1 = get_pdq_hash_from_path_cached(str(image1))
+        hash2, qual2 = get_pdq_hash_from_path_cached(str(image2))
 
         distance = hamming_distance(hash1, hash2)
 
@@ -331,10 +351,13 @@ def scan(
     Finds duplicate/similar images based on PDQ hash distance.
     By default only shows pairs with distance <= 31 (similar).
     """
-    import json
-    from itertools import combinations
-    from pdq_checker import get_pdq_hash_from_path, hamming_distance
-    from rich.progress import Progress
+    from pdq_checker import (
+        get_pdq_hash_from_path,
+        get_cached_pdq_hash,
+        cache_pdq_hash,
+        hashes_to_matrix,
+        pairwise_distance_blocks,
+    )
 
     # Find images
     try:
@@ -350,28 +373,65 @@ def scan(
     console.print(f"[bold]Scanning {len(image_paths)} images in {folder}[/bold]")
     console.print()
 
-    # Compute all hashes
+    # Compute all hashes. Unchanged files come from the hash cache; the rest
+    # are CPU-bound decode + DCT, so they're spread over one process per core
     hashes = {}
     skipped = []
+    hash_results = {}
+    misses = []
 
-    with Progress() as progress:
-        task = progress.add_task("[cyan]Computing hashes...", total=len(image_paths))
-
-        for img_path in image_paths:
-            try:
-                pdq_hash, quality = get_pdq_hash_from_path(str(img_path))
-                if quality >= 50:
-                    hashes[img_path.name] = {
-                        "path": str(img_path),
-                        "hash": pdq_hash,
-                        "quality": quality,
-                    }
-                else:
-                    skipped.append((img_path.name, f"low quality ({quality})"))
-            except Exception as e:
-                skipped.append((img_path.name, str(e)))
-
-            progress.update(task, advance=1)
+    for img_path in image_paths:
+        try:
+            cached = get_cached_pdq_hash(str(img_path))
+        except OSError as e:
+            # Deleted or unreadable since the folder was listed
+            hash_results[img_path] = e
+            continue
+        if cached is not None:
+            hash_results[img_path] = cached
+        else:
+            misses.append(img_path)
+
+    # Small folders finish before a progress bar is worth its rendering cost
+    quiet = len(image_paths) < 50
+
+    with Progress(disable=quiet) as progress:
+        task = progress.add_task(
+            "[cyan]Computing hashes...",
+            total=len(image_paths),
+            completed=len(hash_results),
+        )
+
+        if misses:
+            with ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, len(misses))) as executor:
+                futures = {executor.submit(get_pdq_hash_from_path, str(p)): p for p in misses}
+
+                for future in as_completed(futures):
+                    img_path = futures[future]
+                    try:
+                        hash_results[img_path] = future.result()
+                        cache_pdq_hash(str(img_path), hash_results[img_path])
+                    except Exception as e:
+                        hash_results[img_path] = e
+                    progress.update(task, advance=1)
+
+    # Collect in folder order so results don't depend on completion order
+    for img_path in image_paths:
+        outcome = hash_results[img_path]
+        if isinstance(outcome, Exception):
+            skipped.append((img_path.name, str(outcome)))
+            continue
+
+        pdq_hash, quality = outcome
+
+        if quality >= 50:
+            hashes[img_path.name] = {
+                "path": str(img_path),
+                "hash": pdq_hash,
+                "quality": quality,
+            }
+        else:
+            skipped.append((img_path.name, f"low quality ({quality})"))
 
     if skipped:
         console.print(f"[yellow]Skipped {len(skipped)} images:[/yellow]")
@@ -381,45 +441,89 @@ def scan(
             console.print(f"  ... and {len(skipped) - 5} more")
         console.print()
 
-    # Compare all pairs
+    # Compare all pairs (vectorized over blocks of rows of the distance matrix)
     image_names = list(hashes.keys())
     total_pairs = len(image_names) * (len(image_names) - 1) // 2
 
     console.print(f"Comparing {total_pairs} pairs...")
 
-    results = []
+    hash_matrix = hashes_to_matrix([hashes[name]["hash"] for name in image_names])
+
+    # Only keep what gets displayed (similar pairs, or the closest pairs for
+    # --all) plus running stats. For --output every pair is kept, but as
+    # compact index/distance arrays rather than one dict per pair
+    display_limit = 50
+    keep_all = output is not None
+    pair_blocks = []  # (rows, cols, distances) per block, for --output
+    similar = []
+    closest = []  # (distance, i, j) of the display_limit smallest distances
     similar_count = 0
+    compared = 0
+    min_distance, max_distance, distance_sum = 256, 0, 0
 
-    with Progress() as progress:
+    with Progress(disable=quiet) as progress:
         task = progress.add_task("[cyan]Comparing...", total=total_pairs)
 
-        for img1, img2 in combinations(image_names, 2):
-            distance = hamming_distance(hashes[img1]["hash"], hashes[img2]["hash"])
-
-            is_similar = distance <= threshold
-            if is_similar:
-                similar_count += 1
-
-            results.append({
-                "image1": img1,
-                "image2": img2,
-                "distance": distance,
-                "similar": is_similar,
-            })
-
-            progress.update(task, advance=1)
+        for start, block in pairwise_distance_blocks(hash_matrix):
+            # Keep the strict upper triangle: column c is image start+c, row r is start+r
+            rows, cols = np.nonzero(np.triu(np.ones(block.shape, dtype=bool), k=1))
+            distances = block[rows, cols]
+            rows += start
+            cols += start
+            progress.update(task, advance=len(distances))
+
+            if not len(distances):
+                continue
+
+            compared += len(distances)
+            min_distance = min(min_distance, int(distances.min()))
+            max_distance = max(max_distance, int(distances.max()))
+            distance_sum += int(distances.sum(dtype=np.int64))
+
+            is_similar = distances <= threshold
+            similar_count += int(np.count_nonzero(is_similar))
+
+            # Plain-int indices: indexing a list with NumPy scalars is about 2x slower
+            for i, j, distance in zip(rows[is_similar].tolist(), cols[is_similar].tolist(), distances[is_similar].tolist()):
+                similar.append({
+                    "image1": image_names[i],
+                    "image2": image_names[j],
+                    "distance": distance,
+                    "similar": True,
+                })
+
+            if show_all:
+                # Candidates for the closest pairs: everything up to this block's
+                # display_limit-th smallest distance (ties included)
+                nearest = slice(None)
+                if len(distances) > display_limit:
+                    cutoff = np.partition(distances, display_limit - 1)[display_limit - 1]
+                    nearest = distances <= cutoff
+                closest = heapq.nsmallest(display_limit, closest + list(zip(
+                    distances[nearest].tolist(), rows[nearest].tolist(), cols[nearest].tolist()
+                )))
+
+            if keep_all:
+                pair_blocks.append((
+                    rows.astype(np.int32), cols.astype(np.int32), distances.astype(np.int16)
+                ))
 
     # Sort by distance (most similar first)
-    results.sort(key=lambda x: x["distance"])
+    similar.sort(key=lambda x: x["distance"])
 
     # Display results
     console.print()
 
     if show_all:
-        display_results = results
-        title = f"All Pairs ({len(results)} comparisons)"
+        display_results = [
+            {"image1": image_names[i], "image2": image_names[j], "distance": distance}
+            for distance, i, j in closest
+        ]
+        display_total = compared
+        title = f"All Pairs ({compared} comparisons)"
     else:
-        display_results = [r for r in results if r["similar"]]
+        display_results = similar
+        display_total = similar_count
         title = f"Similar Pairs (distance <= {threshold})"
 
     if display_results:
@@ -429,7 +533,7 @@ def scan(
         table.add_column("Distance", justify="right")
         table.add_column("Status", justify="center")
 
-        for r in display_results[:50]:  # Limit to 50 rows
+        for r in display_results[:display_limit]:
             if r["distance"] <= threshold:
                 status = "[red]SIMILAR[/red]"
             elif r["distance"] <= 50:
@@ -444,8 +548,8 @@ def scan(
                 status,
             )
 
-        if len(display_results) > 50:
-            table.add_row("...", "...", "...", f"[dim]+{len(display_results) - 50} more[/dim]")
+        if display_total > display_limit:
+            table.add_row("...", "...", "...", f"[dim]+{display_total - display_limit} more[/dim]")
 
         console.print(table)
     else:
@@ -458,11 +562,10 @@ def scan(
     console.print(f"  Total pairs:    {total_pairs}")
     console.print(f"  Similar pairs:  {similar_count} (distance <= {threshold})")
 
-    if results:
-        distances = [r["distance"] for r in results]
-        console.print(f"  Min distance:   {min(distances)}")
-        console.print(f"  Max distance:   {max(distances)}")
-        console.print(f"  Avg distance:   {sum(distances) / len(distances):.1f}")
+    if compared:
+        console.print(f"  Min distance:   {min_distance}")
+        console.print(f"  Max distance:   {max_distance}")
+        console.print(f"  Avg distance:   {distance_sum / compared:.1f}")
 
     # Save to JSON if requested
     if output:
@@ -470,7 +573,7 @@ def scan(
             "folder": str(folder),
             "threshold": threshold,
             "images": hashes,
-            "comparisons": results,
+            "comparisons": _encode_comparisons(pair_blocks, image_names, threshold),
             "summary": {
                 "total_images": len(hashes),
                 "skipped_images": len(skipped),
@@ -478,10 +581,37 @@ def scan(
                 "similar_pairs": similar_count,
             }
         }
-        with open(output, "w") as f:
-            json.dump(output_data, f, indent=2)
+        write_json_streaming(output, output_data, stream_key="comparisons")
         console.print(f"\n[bold]Results saved to:[/bold] {output}")
 
 
+def _encode_comparisons(
+    pair_blocks: List[Tuple[np.ndarray, np.ndarray, np.ndarray]],
+    image_names: List[str],
+    threshold: int,
+) -> Iterator[str]:
+    """
+    Yield each compared pair as a JSON object string, most similar first.
+
+    Pairs are generated in (image1, image2) order, so a stable sort by
+    distance gives the same order as sorting the equivalent dicts.
+    """
+    if not pair_blocks:
+        return
+
+    rows, cols, distances = (np.concatenate(parts) for parts in zip(*pair_blocks))
+    order = np.argsort(distances, kind="stable")
+    names_json = [json.dumps(name) for name in image_names]
+
+    for start in range(0, len(order), 65536):
+        chunk = order[start:start + 65536]
+        for i, j, distance in zip(rows[chunk].tolist(), cols[chunk].tolist(), distances[chunk].tolist()):
+            similar = "true" if distance <= threshold else "false"
+            yield (
+                f'{{"image1": {names_json[i]}, "image2": {names_json[j]}, '
+                f'"distance": {distance}, "similar": {similar}}}'
+            )
+
+
 if __name__ == "__main__":
     app()
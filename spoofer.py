@@ -3,11 +3,16 @@ Core spoofing logic: generate image variants that pass PDQ uniqueness checks.
 """
 
 import json
-from dataclasses import dataclass, field, asdict
+import os
+import warnings
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field, fields
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 
+import cv2
+import numpy as np
 from PIL import Image
 from rich.console import Console
 from rich.progress import Progress, TaskID
@@ -15,19 +20,20 @@ from rich.progress import Progress, TaskID
 from image_utils import (
     normalize_exif_orientation,
     pil_to_numpy,
-    numpy_to_pil,
-    save_as_jpeg,
+    save_array_as_jpeg,
     resize_to_target,
     parse_target_size,
 )
+from json_utils import write_json_streaming
 from pdq_checker import (
     get_pdq_hash_from_pil,
-    hamming_distance,
+    get_pdq_hash_from_np,
+    decode_hash,
     is_unique,
     check_quality,
 )
 from augmentations import (
-    apply_augmentation,
+    apply_augmentation_into,
     get_recipe_names,
     create_sized_recipe,
 )
@@ -35,8 +41,41 @@ from augmentations import (
 
 console = Console()
 
+# Long side of the downscaled proxy that attempts are screened on
+PROXY_SIZE = 512
 
-@dataclass
+# Consecutive low-quality results after which a recipe is dropped for an image
+MAX_QUALITY_FAILURES = 5
+
+# Consecutive rejected attempts after which recipe weighting is abandoned
+# and every enabled recipe is sampled evenly again
+UNIFORM_AFTER_REJECTS = 20
+
+# Background threads encoding and writing accepted variants (cv2 releases the GIL)
+JPEG_WRITERS = 4
+
+_io_pool: Optional[ThreadPoolExecutor] = None
+
+
+def _get_io_pool() -> ThreadPoolExecutor:
+    """Return the JPEG writer pool, creating it on first use."""
+    global _io_pool
+    if _io_pool is None:
+        _io_pool = ThreadPoolExecutor(max_workers=JPEG_WRITERS, thread_name_prefix="jpeg-writer")
+    return _io_pool
+
+
+def _reset_io_pool() -> None:
+    # A forked worker inherits the pool object but none of its threads
+    global _io_pool
+    _io_pool = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_io_pool)
+
+
+@dataclass(slots=True)
 class VariantResult:
     """Result for a single generated variant."""
     filename: str
@@ -46,7 +85,23 @@ class VariantResult:
     attempts: int
 
 
-@dataclass
+@dataclass(slots=True)
+class _RecipeStats:
+    """Per-image attempt outcomes for one recipe, used to weight recipe sampling."""
+    attempts: int = 0
+    accepted: int = 0
+
+    def record(self, accepted: bool = False) -> None:
+        self.attempts += 1
+        self.accepted += accepted
+
+
+# Field names for building manifest entries without dataclasses.asdict,
+# which deep-copies recursively on every call
+_VARIANT_FIELDS = tuple(f.name for f in fields(VariantResult))
+
+
+@dataclass(slots=True)
 class ImageResult:
     """Result for processing a single input image."""
     original_path: str
@@ -56,6 +111,7 @@ class ImageResult:
     failed_variants: int = 0
     total_attempts: int = 0
     skipped_reason: Optional[str] = None
+    log: List[str] = field(default_factory=list)  # verbose messages, printed by process_images
 
 
 @dataclass
@@ -71,6 +127,7 @@ class SpoofingConfig:
     enabled_recipes: Optional[List[str]] = None
     dry_run: bool = False
     verbose: bool = False
+    workers: Optional[int] = None  # processes for process_images (None = CPU count)
 
 
 def generate_variants_for_image(
@@ -79,16 +136,24 @@ def generate_variants_for_image(
     config: SpoofingConfig,
     progress: Optional[Progress] = None,
     task_id: Optional[TaskID] = None,
+    target_size: Optional[Tuple[int, int]] = None,
 ) -> ImageResult:
     """
     Generate unique variants for a single image.
 
+    Takes only picklable arguments (besides the optional progress hooks)
+    so it can run in a worker process. Verbose messages are collected in
+    the result's log rather than printed.
+
     Args:
         image_path: Path to input image
-        output_dir: Directory to save variants
+        output_dir: Directory to save variants; variants go in its
+            <image stem> subfolder, which must already exist
         config: Spoofing configuration
         progress: Optional rich Progress instance for updates
         task_id: Optional task ID for progress updates
+        target_size: Already-parsed (width, height); parsed from
+            config.target_size when not given
 
     Returns:
         ImageResult with all generated variants and stats
@@ -99,20 +164,22 @@ def generate_variants_for_image(
         original_quality=0,
     )
 
-    # Load and normalize image
+    if target_size is None:
+        target_size = parse_target_size(config.target_size)
+
+    # Load and normalize image (JPEGs decode at reduced scale when resizing)
     try:
-        original_pil = normalize_exif_orientation(str(image_path))
+        original_pil = normalize_exif_orientation(str(image_path), target_size)
     except Exception as e:
         result.skipped_reason = f"Failed to load image: {e}"
         return result
 
     # Apply target size if specified
-    target_size = parse_target_size(config.target_size)
     if target_size:
         original_pil = resize_to_target(original_pil, target_size)
 
     # Get original PDQ hash
-    original_hash, original_quality = get_pdq_hash_from_pil(original_pil, config.output_quality)
+    original_hash, original_quality = get_pdq_hash_from_pil(original_pil)
     result.original_hash = original_hash
     result.original_quality = original_quality
 
@@ -126,17 +193,45 @@ def generate_variants_for_image(
     original_np = pil_to_numpy(original_pil)
     h, w = original_np.shape[:2]
 
+    # Attempts are screened on a small copy: PDQ only sees a ~64x64
+    # downsample anyway, and the recipes' parameters are relative to the
+    # image size. Only attempts that pass are redone at full resolution
+    proxy_np = None
+    if max(h, w) > PROXY_SIZE:
+        proxy_scale = PROXY_SIZE / max(h, w)
+        proxy_np = pil_to_numpy(
+            resize_to_target(original_pil, (round(w * proxy_scale), round(h * proxy_scale)))
+        )
+
+    # Per-attempt seeds, so a proxy attempt can be replayed at full size
+    seed_source = np.random.default_rng()
+
+    # Output buffers reused by every attempt instead of allocating a new image each time
+    full_buf = np.empty_like(original_np)
+    proxy_buf = np.empty_like(proxy_np) if proxy_np is not None else None
+
+    # Variant writes still in flight; all must finish before returning
+    pending_writes: List[Future] = []
+
     # Determine enabled recipes
-    enabled_recipes = config.enabled_recipes or get_recipe_names()
+    enabled_recipes = list(config.enabled_recipes or get_recipe_names())
+
+    # Consecutive quality failures per recipe; a recipe that keeps failing
+    # on this image is dropped rather than retried
+    quality_failures = dict.fromkeys(enabled_recipes, 0)
 
-    # Accepted variant hashes
-    accepted_hashes: List[str] = []
+    # How each recipe has fared on this image, and the current run of
+    # rejected attempts; sampling favours what works here
+    recipe_stats = {name: _RecipeStats() for name in enabled_recipes}
+    consecutive_rejects = 0
 
-    # Create output subfolder
+    # Accepted variant hashes, decoded once for fast uniqueness checks
+    original_decoded = decode_hash(original_hash)
+    accepted_hashes: List[int] = []
+
+    # Output subfolder (created up front by process_images)
     stem = image_path.stem
     image_output_dir = output_dir / stem
-    if not config.dry_run:
-        image_output_dir.mkdir(parents=True, exist_ok=True)
 
     # Generate variants
     variants_needed = config.variants_per_image
@@ -153,49 +248,81 @@ def generate_variants_for_image(
             attempts_for_variant += 1
             result.total_attempts += 1
 
-            # Apply random augmentation
-            augmented_np, recipe_name = apply_augmentation(
+            seed = int(seed_source.integers(2**63))
+
+            # Same weights for the proxy and the replay, so both pick the same recipe
+            uniform = consecutive_rejects >= UNIFORM_AFTER_REJECTS
+            if consecutive_rejects == UNIFORM_AFTER_REJECTS and config.verbose:
+                result.log.append(
+                    f"  [yellow]{UNIFORM_AFTER_REJECTS} attempts rejected in a row, "
+                    f"sampling all recipes evenly[/yellow]"
+                )
+            recipe_weights = _recipe_weights(enabled_recipes, recipe_stats, uniform)
+
+            if proxy_np is not None:
+                proxy_aug, recipe_name = apply_augmentation_into(
+                    proxy_np,
+                    proxy_buf,
+                    enabled_recipes=enabled_recipes,
+                    rng=np.random.default_rng(seed),
+                    recipe_weights=recipe_weights,
+                )
+                _, _, candidate_quality, _, reject_reason = _check_candidate(
+                    proxy_aug, original_decoded, accepted_hashes, config
+                )
+                _track_quality(recipe_name, candidate_quality, quality_failures, enabled_recipes, config, result)
+                if reject_reason:
+                    recipe_stats[recipe_name].record()
+                    consecutive_rejects += 1
+                    if config.verbose:
+                        result.log.append(f"  [dim]Attempt {attempts_for_variant}: {reject_reason}[/dim]")
+                    continue
+
+            # Apply random augmentation (replaying the proxy's recipe and parameters)
+            augmented_np, recipe_name = apply_augmentation_into(
                 original_np,
-                enabled_recipes=enabled_recipes
+                full_buf,
+                enabled_recipes=enabled_recipes,
+                rng=np.random.default_rng(seed),
+                recipe_weights=recipe_weights,
             )
 
-            # Ensure correct size
+            # Ensure correct size. Every recipe preserves shape, so this is
+            # only a safety net for custom recipes
             if augmented_np.shape[:2] != (h, w):
-                import cv2
-                augmented_np = cv2.resize(augmented_np, (w, h), interpolation=cv2.INTER_LANCZOS4)
-
-            # Convert to PIL and get hash
-            augmented_pil = numpy_to_pil(augmented_np)
-            candidate_hash, candidate_quality = get_pdq_hash_from_pil(augmented_pil, config.output_quality)
-
-            # Check quality
-            if candidate_quality < config.quality_threshold:
-                if config.verbose:
-                    console.print(f"  [dim]Attempt {attempts_for_variant}: quality too low ({candidate_quality})[/dim]")
-                continue
+                warnings.warn(
+                    f"Recipe {recipe_name} returned {augmented_np.shape[:2]}, expected {(h, w)}; resizing",
+                    RuntimeWarning,
+                )
+                interpolation = cv2.INTER_AREA if augmented_np.shape[0] > h else cv2.INTER_LINEAR
+                augmented_np = cv2.resize(augmented_np, (w, h), interpolation=interpolation)
 
-            # Check uniqueness
-            unique, reject_reason = is_unique(
-                candidate_hash,
-                original_hash,
-                accepted_hashes,
-                config.min_distance_from_original,
-                config.min_distance_between_variants,
+            # Re-check at full size
+            candidate_hash, candidate_decoded, candidate_quality, distance, reject_reason = _check_candidate(
+                augmented_np, original_decoded, accepted_hashes, config
             )
+            _track_quality(recipe_name, candidate_quality, quality_failures, enabled_recipes, config, result)
+            recipe_stats[recipe_name].record(accepted=reject_reason is None)
 
-            if not unique:
+            if reject_reason:
+                consecutive_rejects += 1
                 if config.verbose:
-                    console.print(f"  [dim]Attempt {attempts_for_variant}: {reject_reason}[/dim]")
+                    result.log.append(f"  [dim]Attempt {attempts_for_variant}: {reject_reason}[/dim]")
                 continue
 
             # Variant accepted!
-            distance = hamming_distance(candidate_hash, original_hash)
+            consecutive_rejects = 0
             variant_filename = f"{stem}_v{len(result.variants) + 1:02d}.jpg"
             variant_path = image_output_dir / variant_filename
 
-            # Save (unless dry run)
+            # Save (unless dry run) in the background while the next variant is
+            # generated. The writer owns the array from here on, so later
+            # attempts get a fresh buffer instead of overwriting it
             if not config.dry_run:
-                save_as_jpeg(augmented_pil, str(variant_path), config.output_quality)
+                pending_writes.append(_get_io_pool().submit(
+                    save_array_as_jpeg, augmented_np, str(variant_path), config.output_quality
+                ))
+                full_buf = np.empty_like(original_np)
 
             # Record result
             variant_result = VariantResult(
@@ -206,10 +333,10 @@ def generate_variants_for_image(
                 attempts=attempts_for_variant,
             )
             result.variants.append(variant_result)
-            accepted_hashes.append(candidate_hash)
+            accepted_hashes.append(candidate_decoded)
 
             if config.verbose:
-                console.print(
+                result.log.append(
                     f"  [green]Variant {len(result.variants)}: "
                     f"distance={distance}, recipe={recipe_name}, "
                     f"attempts={attempts_for_variant}[/green]"
@@ -226,7 +353,7 @@ def generate_variants_for_image(
             # Failed to generate this variant after max attempts
             result.failed_variants += 1
             if config.verbose:
-                console.print(
+                result.log.append(
                     f"  [yellow]Failed to generate variant {variant_num} "
                     f"after {config.max_attempts_per_variant} attempts[/yellow]"
                 )
@@ -234,12 +361,117 @@ def generate_variants_for_image(
             # Don't keep trying forever if we're struggling
             if result.failed_variants >= 3:
                 if config.verbose:
-                    console.print("  [red]Too many failures, stopping early[/red]")
+                    result.log.append("  [red]Too many failures, stopping early[/red]")
                 break
 
+    # Wait for the writes; re-raises the first failed one
+    for write in pending_writes:
+        write.result()
+
     return result
 
 
+def _check_candidate(
+    candidate_np: np.ndarray,
+    original_decoded: int,
+    accepted_hashes: List[int],
+    config: SpoofingConfig,
+) -> Tuple[str, int, int, int, Optional[str]]:
+    """
+    Hash a candidate variant and run the quality and uniqueness checks.
+
+    Returns:
+        Tuple of (hex_hash, decoded_hash, quality, distance_from_original, reject_reason)
+        - distance_from_original: 0 if the quality check failed first
+        - reject_reason: None if the candidate passes
+    """
+    candidate_hash, candidate_quality = get_pdq_hash_from_np(candidate_np)
+
+    quality_ok, reason = check_quality(candidate_quality, config.quality_threshold)
+    if not quality_ok:
+        return candidate_hash, 0, candidate_quality, 0, reason
+
+    candidate_decoded = decode_hash(candidate_hash)
+    unique, reason, distance = is_unique(
+        candidate_decoded,
+        original_decoded,
+        accepted_hashes,
+        config.min_distance_from_original,
+        config.min_distance_between_variants,
+    )
+    return candidate_hash, candidate_decoded, candidate_quality, distance, reason
+
+
+def _track_quality(
+    recipe_name: str,
+    quality: int,
+    quality_failures: Dict[str, int],
+    enabled_recipes: List[str],
+    config: SpoofingConfig,
+    result: ImageResult,
+) -> None:
+    """
+    Count consecutive low-quality results per recipe.
+
+    After MAX_QUALITY_FAILURES in a row the recipe is removed from
+    enabled_recipes (in place) for the rest of this image, as long as
+    another recipe remains.
+    """
+    if quality >= config.quality_threshold:
+        quality_failures[recipe_name] = 0
+        return
+
+    quality_failures[recipe_name] += 1
+    if quality_failures[recipe_name] >= MAX_QUALITY_FAILURES and len(enabled_recipes) > 1:
+        enabled_recipes.remove(recipe_name)
+        if config.verbose:
+            result.log.append(f"  [yellow]Dropping recipe {recipe_name}: quality keeps failing[/yellow]")
+
+
+def _recipe_weights(
+    enabled_recipes: List[str],
+    recipe_stats: Dict[str, _RecipeStats],
+    uniform: bool,
+) -> List[float]:
+    """
+    Sampling weights for enabled_recipes from this image's attempts so far.
+
+    Each recipe is weighted by its smoothed acceptance rate, so recipes
+    that keep producing unique variants for this image are tried more
+    often. With uniform set, the history is ignored and all recipes get the
+    same weight: a long run of rejects usually means the favoured recipes
+    now land too close to variants they already produced.
+    """
+    if uniform:
+        return [1.0] * len(enabled_recipes)
+
+    return [
+        (recipe_stats[name].accepted + 1) / (recipe_stats[name].attempts + 2)
+        for name in enabled_recipes
+    ]
+
+
+def _remove_if_empty(directory: Path) -> None:
+    """Remove a directory if it is empty; anything else leaves it in place."""
+    try:
+        directory.rmdir()
+    except OSError:
+        pass
+
+
+def _init_worker(cv2_threads: int) -> None:
+    """Process pool initializer: split the cores between workers' OpenCV thread pools."""
+    cv2.setNumThreads(cv2_threads)
+
+
+def _print_log(image_path: Path, result: ImageResult, config: SpoofingConfig) -> None:
+    """Print an image's collected verbose messages."""
+    if config.verbose:
+        console.print(f"\n[bold]Processing: {image_path.name}[/bold]")
+        for line in result.log:
+            console.print(line)
+
+
 def process_images(
     input_dir: Path,
     output_dir: Path,
@@ -249,6 +481,10 @@ def process_images(
     """
     Process multiple images and generate variants.
 
+    Images are independent and CPU-bound, so with more than one worker
+    each image runs in its own process. Results are stored in the
+    manifest in input order regardless of completion order.
+
     Args:
         input_dir: Input directory path
         output_dir: Output directory path
@@ -280,6 +516,18 @@ def process_images(
     total_distance = 0
     successful_images = 0
 
+    # Parse once up front (a bad size fails here, before any worker starts)
+    target_size = parse_target_size(config.target_size)
+
+    # Create every per-image subfolder before any work starts, instead of
+    # one mkdir per image on the worker's critical path
+    if not config.dry_run:
+        for image_path in image_paths:
+            os.makedirs(output_dir / image_path.stem, exist_ok=True)
+
+    results: Dict[Path, ImageResult] = {}
+    workers = min(config.workers or os.cpu_count() or 1, len(image_paths))
+
     with Progress() as progress:
         # Overall progress
         overall_task = progress.add_task(
@@ -287,45 +535,82 @@ def process_images(
             total=len(image_paths)
         )
 
-        for image_path in image_paths:
-            if config.verbose:
-                console.print(f"\n[bold]Processing: {image_path.name}[/bold]")
+        if workers <= 1:
+            # One variant task reset per image; adding and removing a task
+            # for every image forces a relayout and repaint each time
+            variant_task = progress.add_task("", total=config.variants_per_image)
 
-            # Per-image variant progress
-            variant_task = progress.add_task(
-                f"  [dim]{image_path.name}[/dim]",
-                total=config.variants_per_image
-            )
+            for image_path in image_paths:
+                progress.reset(
+                    variant_task,
+                    total=config.variants_per_image,
+                    description=f"  [dim]{image_path.name}[/dim]",
+                )
 
-            result = generate_variants_for_image(
-                image_path,
-                output_dir,
-                config,
-                progress,
-                variant_task,
-            )
+                results[image_path] = generate_variants_for_image(
+                    image_path,
+                    output_dir,
+                    config,
+                    progress,
+                    variant_task,
+                    target_size,
+                )
+                _print_log(image_path, results[image_path], config)
+
+                progress.update(overall_task, advance=1)
 
-            # Store in manifest
-            manifest["images"][image_path.name] = {
-                "original_hash": result.original_hash,
-                "original_quality": result.original_quality,
-                "variants": [asdict(v) for v in result.variants],
-                "failed_variants": result.failed_variants,
-                "total_attempts": result.total_attempts,
-                "skipped_reason": result.skipped_reason,
-            }
-
-            # Update stats
-            if result.skipped_reason:
-                manifest["summary"]["skipped_images"] += 1
-            else:
-                successful_images += 1
-                total_variants += len(result.variants)
-                for v in result.variants:
-                    total_distance += v.distance_from_original
-
-            progress.update(overall_task, advance=1)
             progress.remove_task(variant_task)
+        else:
+            # With fewer images than cores, the spare cores go to each worker's
+            # OpenCV threads, which parallelize the full-size warps and resizes
+            # (pdqhash holds the GIL, so threading attempts within an image
+            # would only speed up the same OpenCV part)
+            cv2_threads = max(1, (os.cpu_count() or 1) // workers)
+
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(cv2_threads,),
+            ) as executor:
+                futures = {
+                    executor.submit(
+                        generate_variants_for_image, image_path, output_dir, config, target_size=target_size
+                    ): image_path
+                    for image_path in image_paths
+                }
+
+                for future in as_completed(futures):
+                    image_path = futures[future]
+                    results[image_path] = future.result()
+                    _print_log(image_path, results[image_path], config)
+                    progress.update(overall_task, advance=1)
+
+    for image_path in image_paths:
+        result = results[image_path]
+
+        # Folders were made up front; drop the ones left empty by skipped or
+        # fruitless images, as if they had never been created
+        if not config.dry_run and (result.skipped_reason or not result.variants):
+            _remove_if_empty(output_dir / image_path.stem)
+
+        # Store in manifest
+        manifest["images"][image_path.name] = {
+            "original_hash": result.original_hash,
+            "original_quality": result.original_quality,
+            "variants": [{name: getattr(v, name) for name in _VARIANT_FIELDS} for v in result.variants],
+            "failed_variants": result.failed_variants,
+            "total_attempts": result.total_attempts,
+            "skipped_reason": result.skipped_reason,
+        }
+
+        # Update stats
+        if result.skipped_reason:
+            manifest["summary"]["skipped_images"] += 1
+        else:
+            successful_images += 1
+            total_variants += len(result.variants)
+            for v in result.variants:
+                total_distance += v.distance_from_original
 
     # Finalize summary
     manifest["summary"]["total_images"] = len(image_paths)
@@ -343,7 +628,18 @@ def process_images(
 
 
 def save_manifest(manifest: Dict[str, Any], output_dir: Path) -> None:
-    """Save manifest to JSON file."""
-    manifest_path = output_dir / "manifest.json"
-    with open(manifest_path, 'w') as f:
-        json.dump(manifest, f, indent=2)
+    """
+    Save manifest to JSON file.
+
+    Each image entry is encoded on its own line by the C JSON encoder and
+    written as it goes; json.dump(indent=2) runs the pure-Python encoder
+    over the whole manifest, which dominates on large batches. The other
+    sections are indented as before.
+    """
+    entries = (f"{json.dumps(name)}: {json.dumps(entry)}" for name, entry in manifest["images"].items())
+    write_json_streaming(
+        output_dir / "manifest.json",
+        {**manifest, "images": entries},
+        stream_key="images",
+        container="{}",
+    )
@@ -0,0 +1,59 @@
+"""Tests for image_utils resizing and size parsing."""
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from image_utils import parse_target_size, resize_to_target
+
+
+@pytest.mark.parametrize("size, box", [
+    ((4000, 1350), (1080, 1350)),
+    ((4000, 3000), (1080, 1350)),
+    ((3000, 4000), (1080, 1350)),
+    ((1333, 777), (500, 500)),
+    ((999, 1), (10, 10)),
+])
+def test_fit_matches_thumbnail(size, box):
+    expected = Image.new("RGB", size)
+    expected.thumbnail(box)
+
+    assert resize_to_target(Image.new("RGB", size), box).size == expected.size
+
+
+def test_palette_image_keeps_its_colours():
+    indices = np.zeros((600, 800), dtype=np.uint8)
+    indices[:, 400:] = 1
+    image = Image.fromarray(indices, "P")
+    image.putpalette([0, 0, 0, 255, 0, 0])
+
+    resized = resize_to_target(image, (400, 400))
+
+    assert resized.mode == "P"
+    assert resized.size == (400, 300)
+    colours = np.unique(np.asarray(resized.convert("RGB")).reshape(-1, 3), axis=0)
+    assert colours.tolist() == [[0, 0, 0], [255, 0, 0]]
+    # The input is left untouched
+    assert image.size == (800, 600)
+
+
+def test_bilevel_image_resizes():
+    resized = resize_to_target(Image.new("1", (800, 600), 1), (400, 400))
+
+    assert resized.mode == "1"
+    assert resized.size == (400, 300)
+
+
+@pytest.mark.parametrize("size_str, expected", [
+    ("1080x1350", (1080, 1350)),
+    (" 1080 X 1350 ", (1080, 1350)),
+    ("0100x1", (100, 1)),
+])
+def test_parse_target_size(size_str, expected):
+    assert parse_target_size(size_str) == expected
+
+
+@pytest.mark.parametrize("size_str", ["0x100", "100x0", "00x5", "x100", "100", "-5x10", "1.5x2"])
+def test_parse_target_size_rejects(size_str):
+    with pytest.raises(ValueError):
+        parse_target_size(size_str)
@@ -0,0 +1,27 @@
+"""Tests for the streaming JSON writer."""
+
+import json
+
+import pytest
+
+from json_utils import write_json_streaming
+
+
+@pytest.mark.parametrize("members", [[], [{"a": 1}, [2, 3], "x"]])
+def test_list_section_round_trips(tmp_path, members):
+    data = {"before": {"k": [1, 2]}, "items": (json.dumps(m) for m in members), "after": 3}
+    path = tmp_path / "out.json"
+
+    write_json_streaming(path, data, stream_key="items")
+
+    assert json.loads(path.read_text()) == {"before": {"k": [1, 2]}, "items": members, "after": 3}
+
+
+@pytest.mark.parametrize("entries", [{}, {"a.jpg": {"v": [1]}, "b\"c.png": {}}])
+def test_object_section_round_trips(tmp_path, entries):
+    encoded = (f"{json.dumps(k)}: {json.dumps(v)}" for k, v in entries.items())
+    path = tmp_path / "out.json"
+
+    write_json_streaming(path, {"images": encoded, "n": len(entries)}, stream_key="images", container="{}")
+
+    assert json.loads(path.read_text()) == {"images": entries, "n": len(entries)}
@@ -0,0 +1,30 @@
+"""Tests for the CLI commands in main.py."""
+
+import numpy as np
+from PIL import Image
+from typer.testing import CliRunner
+
+import pdq_checker
+from main import app
+
+
+def test_scan_skips_file_deleted_after_listing(tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    for name in ("a.png", "b.png", "gone.png"):
+        Image.fromarray(rng.integers(0, 256, (64, 64, 3), dtype=np.uint8)).save(tmp_path / name)
+
+    monkeypatch.setattr(pdq_checker, "_hash_cache", pdq_checker._HashCache(tmp_path / "cache.json"))
+    real_lookup = pdq_checker.get_cached_pdq_hash
+
+    def lookup(image_path):
+        if image_path.endswith("gone.png"):
+            raise FileNotFoundError(image_path)
+        return real_lookup(image_path)
+
+    monkeypatch.setattr(pdq_checker, "get_cached_pdq_hash", lookup)
+
+    result = CliRunner().invoke(app, ["scan", str(tmp_path), "--all"])
+
+    assert result.exit_code == 0, result.output
+    assert "gone.png" in result.output
+    assert "Skipped 1 images" in result.output
@@ -0,0 +1,49 @@
+"""Tests for the vectorized hamming distance kernels in pdq_checker."""
+
+import numpy as np
+import pytest
+
+import pdq_checker
+from pdq_checker import hamming_distance, hashes_to_matrix, pairwise_distance_blocks
+
+
+@pytest.fixture(params=[True, False], ids=["bitwise_count", "swar"])
+def popcount_path(request, monkeypatch):
+    if request.param and not hasattr(np, "bitwise_count"):
+        pytest.skip("np.bitwise_count needs NumPy >= 2.0")
+    monkeypatch.setattr(pdq_checker, "_HAS_BITWISE_COUNT", request.param)
+
+
+def random_hashes(n, seed=0):
+    rng = np.random.default_rng(seed)
+    hashes = [rng.integers(0, 256, 32, dtype=np.uint8).tobytes().hex() for _ in range(n)]
+    # Edge cases: identical, all-zero and all-one hashes
+    return hashes + [hashes[0], "0" * 64, "f" * 64]
+
+
+@pytest.mark.parametrize("block_rows", [None, 1, 4, 7, 1000])
+@pytest.mark.parametrize("workers", [1, 3])
+def test_blocks_match_hamming_distance(popcount_path, block_rows, workers):
+    hashes = random_hashes(30)
+    n = len(hashes)
+
+    seen = np.full((n, n), -1)
+    for start, distances in pairwise_distance_blocks(hashes_to_matrix(hashes), block_rows, workers):
+        assert distances.shape[1] == n - start
+        seen[start:start + len(distances), start:] = distances
+
+    for i in range(n):
+        for j in range(i, n):
+            assert seen[i, j] == hamming_distance(hashes[i], hashes[j]), (i, j)
+
+
+def test_swar_popcount_matches_bin_count():
+    rng = np.random.default_rng(1)
+    values = np.concatenate([
+        rng.integers(0, 2**64, 1000, dtype=np.uint64),
+        np.array([0, 1, 2**63, 2**64 - 1], dtype=np.uint64),
+    ])
+
+    counts = pdq_checker._popcount64(values.copy())
+
+    assert counts.tolist() == [bin(int(v)).count("1") for v in values]
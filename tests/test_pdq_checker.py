@@ -0,0 +1,96 @@
+"""Tests for the on-disk PDQ hash cache in pdq_checker."""
+
+import json
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import pdq_checker
+
+
+@pytest.fixture
+def image_file(tmp_path):
+    rng = np.random.default_rng(0)
+    path = tmp_path / "image.png"
+    Image.fromarray(rng.integers(0, 256, (64, 64, 3), dtype=np.uint8)).save(path)
+    return path
+
+
+def test_no_cache_path_without_home(monkeypatch):
+    # No HOME and no passwd entry: Path.home() raises RuntimeError
+    pwd = pytest.importorskip("pwd")
+    monkeypatch.delenv("HOME", raising=False)
+    monkeypatch.delenv("XDG_CACHE_HOME", raising=False)
+
+    def no_passwd_entry(uid):
+        raise KeyError(uid)
+
+    monkeypatch.setattr(pwd, "getpwuid", no_passwd_entry)
+
+    assert pdq_checker._default_cache_path() is None
+
+
+def test_hash_without_cache_path(monkeypatch, image_file):
+    monkeypatch.setattr(pdq_checker, "_default_cache_path", lambda: None)
+    cache = pdq_checker._HashCache()
+    monkeypatch.setattr(pdq_checker, "_hash_cache", cache)
+
+    pdq_hash, quality = pdq_checker.get_pdq_hash_from_path_cached(str(image_file))
+    assert len(pdq_hash) == 64
+    assert (pdq_hash, quality) == pdq_checker.get_pdq_hash_from_path(str(image_file))
+
+    # Caching is simply off: saving writes nothing and doesn't raise
+    cache.save()
+    assert cache.path is None
+
+
+def test_save_prunes_missing_files(tmp_path, image_file):
+    cache_path = tmp_path / "cache" / "pdq.json"
+    cache = pdq_checker._HashCache(cache_path)
+
+    cache.put(pdq_checker._file_key(str(image_file)), ("a" * 64, 100))
+    cache.put((str(tmp_path / "deleted.png"), 1, 2), ("b" * 64, 100))
+    cache.save()
+
+    with open(cache_path) as f:
+        entries = json.load(f)
+    assert list(entries) == [os.path.abspath(image_file)]
+
+
+def test_save_caps_entry_count(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdq_checker, "_MAX_CACHE_ENTRIES", 3)
+    paths = []
+    for i in range(5):
+        path = tmp_path / f"{i}.png"
+        path.write_bytes(b"")
+        paths.append(str(path))
+
+    cache = pdq_checker._HashCache(tmp_path / "pdq.json")
+    for path in paths:
+        cache.put((path, 0, 0), ("c" * 64, 100))
+    # Rewriting an old entry makes it the newest
+    cache.put((paths[0], 0, 0), ("d" * 64, 100))
+    cache.save()
+
+    with open(tmp_path / "pdq.json") as f:
+        entries = json.load(f)
+    assert list(entries) == [paths[3], paths[4], paths[0]]
+
+
+def test_malformed_entries_are_misses(tmp_path):
+    good = [1, 2, "0123456789abcdef" * 4, 100]
+    cache_path = tmp_path / "pdq.json"
+    cache_path.write_text(json.dumps({
+        "/good.png": good,
+        "/truncated.png": [1, 2],
+        "/not-hex.png": [1, 2, "xyz" * 21 + "x", 100],
+        "/string-size.png": [1, "2", good[2], 100],
+        "/not-a-list.png": {"hash": good[2]},
+    }))
+    cache = pdq_checker._HashCache(cache_path)
+
+    assert cache.get(("/good.png", 1, 2)) == (good[2], 100)
+    for path in ("/truncated.png", "/not-hex.png", "/string-size.png", "/not-a-list.png"):
+        assert cache.get((path, 1, 2)) is None